@@ -0,0 +1,56 @@
+"""
+ingestion benchmark.
+compares the notebook's path (pd.read_csv + to_dict + type_fix + fix_team_names) with ingest.read_game_log,
+and times reading every integration file with ingest.read_integration.
+usage: python benchmark.py [game_log.csv]
+"""
+import os
+import sys
+import time
+import pandas as pd
+from feature_engineering import type_fix, fix_team_names
+from ingest import read_game_log, read_integration, game_records, integrations
+
+def timed(f, *args, **kwargs):
+    start = time.perf_counter()
+    result = f(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+def legacy_ingest(path):
+    df = pd.read_csv(path).to_dict("records")
+    type_fix(df)
+    fix_team_names(df)
+    return df
+
+def typed_ingest(path):
+    return game_records(read_game_log(path))
+
+def differing_columns(legacy, typed):
+    """
+    columns whose values differ between the two record lists. missing values (nan) in both count as equal
+    """
+    legacy, typed = pd.DataFrame(legacy), pd.DataFrame(typed)
+    if len(legacy) != len(typed):
+        return ['<{} vs {} games>'.format(len(legacy), len(typed))]
+    columns = list(legacy.columns) + [column for column in typed.columns if column not in legacy]
+    return [column for column in columns
+            if column not in legacy or column not in typed or not legacy[column].equals(typed[column])]
+
+def main(path="GL1990_2017.csv"):
+    legacy, legacy_time = timed(legacy_ingest, path)
+    typed, typed_time = timed(typed_ingest, path)
+    frame = read_game_log(path)
+    print("game log: {} games".format(len(typed)))
+    print("  legacy ingest:  {:.2f}s ({:.1f} MB)".format(
+        legacy_time, pd.read_csv(path).memory_usage(deep=True).sum() / 2**20))
+    print("  typed ingest:   {:.2f}s ({:.1f} MB)".format(typed_time, frame.memory_usage(deep=True).sum() / 2**20))
+    differing = differing_columns(legacy, typed)
+    print("  same records:   {}".format("True" if not differing else "False, differing columns: {}".format(differing)))
+
+    for name, schema in integrations.items():
+        if os.path.exists(schema['file']):
+            integration, integration_time = timed(read_integration, name)
+            print("{}: {} rows in {:.2f}s".format(name, len(integration), integration_time))
+
+if __name__ == '__main__':
+    main(*sys.argv[1:])
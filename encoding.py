@@ -0,0 +1,151 @@
+"""
+design matrix encoder shared by training and prediction.
+the categorical vocabularies (teams, divisions, parks, game time, leagues) are learned once and saved with the model.
+a game table is encoded into a float32 dense block of the numeric / coded columns and a one-hot block of the
+team, division and park columns.
+exported design matrices are written to disk as matrix.npy - the dense block followed by the (densified, ~120 columns)
+one-hot block, filled through a memory map - and one_hot.npz, the one-hot block alone as CSR for sparse models.
+matrix.npy is loaded back as a read-only float32 memory map, which estimators taking float32 input (e.g. random
+forests) use without copying. converting it to float64 or combining it into a sparse matrix copies it.
+"""
+import json
+import os
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+post_game_features = [ # known only after the game / identifiers. never part of the model matrix
+    'attendance', 'winning_team', 'completion_info', 'acquisition_info', 'visiting_team_runs', 'home_team_runs',
+    'visiting_team_hits', 'visiting_team_home_runs', 'home_team_hits', 'home_team_home_runs', 'winning_pitcher_id', 'winning_pitcher_name', 'losing_pitcher_id', 'losing_pitcher_name',
+    'saving_pitcher_id', 'saving_pitcher_name', 'game_winning_rbi_batter_id', 'game_winning_rbi_batter_name',
+] + ['{}_pitcher_{}'.format(team, field) for team in ('visiting', 'home') for field in ('id', 'name')] \
+  + ['{}_player{}_{}'.format(team, i, field) for team in ('visiting', 'home') for i in range(1, 10) for field in ('id', 'name')]
+
+one_hot_columns = ['visiting_team', 'home_team', 'visiting_team_division', 'home_team_division', 'park_id']
+days = ['Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun']
+
+class DesignEncoder:
+    """
+    one_hot: vocabulary per one-hot encoded column
+    codes: vocabulary per column encoded as a single integer code (ordered categories)
+    dense_columns: columns of the dense block, in order
+    """
+    def __init__(self, one_hot=None, codes=None, dense_columns=None):
+        self.one_hot = one_hot or {}
+        self.codes = codes or {}
+        self.dense_columns = dense_columns or []
+
+    def fit(self, frame, dense_columns=None):
+        """
+        learn the vocabularies from a game table (DataFrame). one-hot columns missing from it are left out.
+        dense_columns: columns for the dense block. default: every numeric / coded column that is not post game
+        """
+        self.one_hot = {column: sorted(frame[column].dropna().unique().tolist()) for column in one_hot_columns if column in frame}
+        leagues = sorted(set(frame['visiting_team_league'].dropna()) | set(frame['home_team_league'].dropna()))
+        self.codes = {'day_of_week': days,
+                      'game_time': sorted(frame['game_time'].dropna().unique().tolist()),
+                      'visiting_team_league': leagues,
+                      'home_team_league': leagues}
+        if dense_columns is None:
+            dense_columns = [column for column in frame.columns
+                             if column not in post_game_features and column not in self.one_hot and
+                             (column in self.codes or column == 'date' or
+                              pd.api.types.is_numeric_dtype(frame[column]) or pd.api.types.is_bool_dtype(frame[column]))]
+        self.dense_columns = list(dense_columns)
+        return self
+
+    def feature_names(self):
+        return self.dense_columns + ['{}_{}'.format(column, value)
+                                     for column, vocabulary in self.one_hot.items() for value in vocabulary]
+
+    def dense_column(self, frame, column):
+        if column == 'date':
+            return pd.to_datetime(frame[column]).map(lambda dt: dt.toordinal()).to_numpy(dtype=np.float32)
+        if column in self.codes: # unseen values get code -1, like cat.codes for missing values
+            return pd.Categorical(frame[column], categories=self.codes[column]).codes.astype(np.float32)
+        return frame[column].to_numpy(dtype=np.float32)
+
+    def transform_dense(self, frame, out=None):
+        """
+        float32 dense block. out: preallocated (games, dense columns) array to fill, e.g. a memory map
+        """
+        if out is None:
+            out = np.empty((len(frame), len(self.dense_columns)), dtype=np.float32)
+        for i, column in enumerate(self.dense_columns):
+            out[:, i] = self.dense_column(frame, column)
+        return out
+
+    def one_hot_positions(self, frame):
+        """
+        (rows, columns) of the ones of the one-hot block. values outside the learned vocabularies are all zeros
+        """
+        rows, cols = [], []
+        offset = 0
+        for column, vocabulary in self.one_hot.items():
+            codes = pd.Categorical(frame[column], categories=vocabulary).codes
+            found = np.flatnonzero(codes >= 0)
+            rows.append(found)
+            cols.append(codes[found].astype(np.int64) + offset)
+            offset += len(vocabulary)
+        return np.concatenate(rows), np.concatenate(cols)
+
+    def transform_one_hot(self, frame):
+        """
+        CSR block of the one-hot columns
+        """
+        rows, cols = self.one_hot_positions(frame)
+        width = sum(len(vocabulary) for vocabulary in self.one_hot.values())
+        return sparse.csr_matrix((np.ones(len(rows), dtype=np.float32), (rows, cols)), shape=(len(frame), width))
+
+    def transform(self, frame):
+        return self.transform_one_hot(frame), self.transform_dense(frame)
+
+    def matrix(self, frame, out=None):
+        """
+        float32 model matrix: the dense block followed by the densified one-hot block, e.g. for model.predict.
+        out: preallocated (games, features) array to fill, e.g. a memory map
+        """
+        if out is None:
+            out = np.empty((len(frame), len(self.feature_names())), dtype=np.float32)
+        dense = len(self.dense_columns)
+        self.transform_dense(frame, out=out[:, :dense])
+        out[:, dense:] = 0
+        rows, cols = self.one_hot_positions(frame)
+        out[rows, dense + cols] = 1
+        return out
+
+    def save(self, path):
+        with open(path, 'w') as fp:
+            json.dump({'one_hot': self.one_hot, 'codes': self.codes, 'dense_columns': self.dense_columns}, fp)
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as fp:
+            return cls(**json.load(fp))
+
+def export(encoder, frame, directory, target=None):
+    """
+    write the model matrix of a game table to directory: matrix.npy (float32), one_hot.npz (CSR),
+    the encoder vocabularies (encoder.json) and optionally the target (target.npy)
+    """
+    os.makedirs(directory, exist_ok=True)
+    sparse.save_npz(os.path.join(directory, 'one_hot.npz'), encoder.transform_one_hot(frame))
+    matrix = np.lib.format.open_memmap(os.path.join(directory, 'matrix.npy'), mode='w+', dtype=np.float32,
+                                       shape=(len(frame), len(encoder.feature_names())))
+    encoder.matrix(frame, out=matrix) # written straight into the file
+    matrix.flush()
+    del matrix
+    encoder.save(os.path.join(directory, 'encoder.json'))
+    if target is not None:
+        np.save(os.path.join(directory, 'target.npy'), np.asarray(target))
+
+def load_design(directory):
+    """
+    returns (encoder, one-hot CSR block, model matrix as a read-only float32 memory map, target or None).
+    the dense block is matrix[:, :len(encoder.dense_columns)], a view
+    """
+    target_path = os.path.join(directory, 'target.npy')
+    return (DesignEncoder.load(os.path.join(directory, 'encoder.json')),
+            sparse.load_npz(os.path.join(directory, 'one_hot.npz')),
+            np.load(os.path.join(directory, 'matrix.npy'), mmap_mode='r'),
+            np.load(target_path) if os.path.exists(target_path) else None)
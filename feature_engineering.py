@@ -1,17 +1,29 @@
+import numpy as np
 from numpy import mean, std
-import csv
 import math
 import copy
 from bisect import bisect_left as bisect
 from collections import defaultdict
+from itertools import groupby
 from datetime import date, datetime
+from functools import lru_cache
+from lookups import compile_lookup, gather, row_stats
+from ingest import team_renames, read_integration, read_integration_chunks
+from lineups import sides, lineup_matrix, resolve, appearance_counts, masked_max, masked_mean
+
+@lru_cache(maxsize=None)
+def parse_date(dt):
+    """
+    parse a '%m/%d/%Y' date string. memoized - there are only a few thousand distinct dates across all files
+    """
+    return datetime.strptime(dt,'%m/%d/%Y').date()
 
 def type_fix(df):
     """
     fix the types of the columns
     """
     for r in df:
-        r['date'] = datetime.strptime(r['date'],'%m/%d/%Y').date()
+        r['date'] = parse_date(r['date'])
         r['number_of_game'] = int(r['number_of_game'])
         r['visiting_team_game_number'] = int(r['visiting_team_game_number'])
         r['home_team_game_number'] = int(r['home_team_game_number'])
@@ -26,25 +38,31 @@ def fix_team_names(df):
     """
     for teams that have changed names at some point
     """
-    teams = {'FLO':'MIA', 'CAL':'ANA'}
     for r in df:
         for team in ['home_team', 'visiting_team']:
-            r[team] = teams.get(r[team], r[team])
+            r[team] = team_renames.get(r[team], r[team])
+
+def load_divisions():
+    """
+    division per (season, team) from external integration
+    """
+    frame = read_integration('divisions')
+    return dict(zip(zip(frame['season'].tolist(), frame['team'].tolist()), frame['division'].tolist()))
 
 def divisions(df):
     """
     add team's division to dataset from external integration.
     teams compete to be the team with the most wins in their deivision in order to reach playoffs
     """
-    divisions = {}
-    with open("divisions.csv", encoding='utf-8-sig') as fp:
-        reader = csv.DictReader(fp)
-        for r in reader:
-            divisions[int(r['season']), r['team']] = r['division']
+    divisions = load_divisions()
+    labels = sorted(set(divisions.values()))
+    lookup = compile_lookup({key: labels.index(division) for key, division in divisions.items()}, np.int8)
 
-    for r in df:
-        for team in ['visiting_team', 'home_team']:
-            r[team+'_division'] = divisions[r['season'], r[team]]
+    seasons = [r['season'] for r in df]
+    for team in ['visiting_team', 'home_team']:
+        codes, _ = gather(lookup, seasons, [r[team] for r in df], 'divisions')
+        for r, code in zip(df, codes.tolist()):
+            r[team+'_division'] = labels[code]
 
 def loss_count(df):
     current_count = defaultdict(int)# holds the metric count per team / season up until a given point in time
@@ -58,19 +76,22 @@ def loss_count(df):
             if r['winning_team'] != r[team]:
                 current_count[r['season'], r[team]] += 1 #team lost, increment loss counter
                 
+def load_park_capacities():
+    """
+    official park capacity per (season, park_id) from external integration
+    """
+    frame = read_integration('park_capacities')
+    return dict(zip(zip(frame['season'].tolist(), frame['park_id'].tolist()), frame['park_capacity'].tolist()))
+
 def park_capacity(df):
     """
     add official park capacity from external integration
     note: attendance can sometimes be higher than the park capacity (added standing room for instance)
     """
-    park_capacities = {}
-    with open("park_capacities.csv", encoding='utf-8-sig') as fp:
-        reader = csv.DictReader(fp)
-        for r in reader:
-            park_capacities[int(r['season']), r['park_id']] = r['park_capacity']
-
-    for r in df:
-        r['park_capacity'] = park_capacities[r['season'], r['park_id']]
+    lookup = compile_lookup(load_park_capacities(), np.int32)
+    capacities, _ = gather(lookup, [r['season'] for r in df], [r['park_id'] for r in df], 'park_capacity')
+    for r, capacity in zip(df, capacities.tolist()):
+        r['park_capacity'] = capacity
 
 # @hidden_cell
 
@@ -85,6 +106,20 @@ def normalize(pop, val, cache=None,key=None):
         m,s = mean(pop), std(pop)
     return (val - m)/s if s else 0
 
+def normalize_array(values, m, s):
+    """
+    vectorized normalize: (values - m) / s, 0 where s is 0
+    """
+    return np.divide(values - m, s, out=np.zeros(np.broadcast(values, m, s).shape), where=s != 0)
+
+def season_stats(seasons, populations):
+    """
+    mean / std of each row's season population, as arrays aligned with seasons
+    populations: dict season -> list of values to normalize against
+    """
+    stats = {season: (mean(populations[season]), std(populations[season])) for season in set(seasons.tolist())}
+    return np.array([stats[season][0] for season in seasons.tolist()]), np.array([stats[season][1] for season in seasons.tolist()])
+
 def streaks(df):
     """
     calculate winning/losing streak. How many games in a row has the team won / lost up until the current game.
@@ -126,6 +161,74 @@ def cumulative_metric(df,metric):
                 r['cumulative_{}_{}_normalized'.format(team, metric)] = normalize(pop,r['cumulative_{}_{}'.format(team,metric)], norm_cache, (r['season'], r[team+'_game_number']))
             else:
                 r['cumulative_{}_{}_normalized'.format(team, metric)] = 0
+
+rolling_metrics = ('win_pct', 'runs', 'hits', 'home_runs', 'home_attendance')
+rolling_windows = (7, 15, 30)
+
+def rolling_form(df, windows=rolling_windows):
+    """
+    recent form over the team's last n games for each window size n:
+    win_pct, runs, hits, home_runs: average over the team's last n games
+    home_attendance: average attendance over the team's last n home games
+    values are kept in a ring buffer per season / team / metric with a running sum per window,
+    so each game updates all windows in O(1) no matter the window size.
+    normalized the same way as cumulative_metric.
+    """
+    size = max(windows)
+    buffers = defaultdict(lambda: [0]*size) # last `size` values per season / team / metric
+    counts = defaultdict(int) # number of values seen per season / team / metric
+    sums = defaultdict(float) # running sum of the last n values per season / team / metric / window
+    norm = defaultdict(list) # all values to be used to normalize the feature
+
+    def push(key, value):
+        buffer, n = buffers[key], counts[key]
+        for w in windows:
+            sums[key + (w,)] += value
+            if n >= w:
+                sums[key + (w,)] -= buffer[(n - w) % size] # value leaving the window
+        buffer[n % size] = value
+        counts[key] = n + 1
+
+    def window_mean(key, w):
+        n = min(counts[key], w)
+        return sums[key + (w,)] / n if n else None
+
+    metrics = rolling_metrics
+    missing = set() # (row, column) with no games in the window yet
+    for i, r in enumerate(df):
+        for team in ('home_team', 'visiting_team'):
+            # enter values into dataset before adding this game's outcome
+            for metric in metrics:
+                for w in windows:
+                    column = '{}_last{}_{}'.format(team, w, metric)
+                    value = window_mean((r['season'], r[team], metric), w)
+                    if value is None:
+                        missing.add((i, column))
+                        r[column] = 0
+                    else:
+                        r[column] = value
+                        norm[metric, w, r['season'], r[team+'_game_number']].append(value)
+
+            push((r['season'], r[team], 'win_pct'), 1 if r['winning_team'] == r[team] else 0)
+            for metric in ('runs', 'hits', 'home_runs'):
+                push((r['season'], r[team], metric), r['_'.join([team, metric])])
+
+        attendance = r.get('attendance')
+        if attendance and attendance == attendance: # 0 / nan = unknown attendance
+            push((r['season'], r['home_team'], 'home_attendance'), attendance)
+
+    norm_cache = {}
+    for i, r in enumerate(df):
+        for team in ('home_team', 'visiting_team'):
+            for metric in metrics:
+                for w in windows:
+                    column = '{}_last{}_{}'.format(team, w, metric)
+                    key = (metric, w, r['season'], r[team+'_game_number'])
+                    # don't calculate this field if there haven't been enough games played this season. not enough data
+                    if r[team+'_game_number'] > 10 and (i, column) not in missing:
+                        r[column+'_normalized'] = normalize(norm[key], r[column], norm_cache, key)
+                    else:
+                        r[column+'_normalized'] = 0
                 
 def intradivision(df):
     """
@@ -145,34 +248,46 @@ def interleague(df):
     for r in df:
         r['interleague'] = r['visiting_team_league'] != r['home_team_league']
         
+def load_holidays():
+    """
+    set of (date, home_team) holiday games from external integration
+    """
+    frame = read_integration('holidays')
+    return set(zip(frame['date'].tolist(), frame['home_team'].tolist()))
+
+def holiday_flags(dates, home_teams):
+    """
+    holiday flag for every (date, home_team), as a single lookup into a (date ordinal x team) table
+    """
+    lookup = compile_lookup({(dt.toordinal(), team): True for dt, team in load_holidays()}, bool)
+    flags, _ = gather(lookup, [dt.toordinal() for dt in dates], list(home_teams))
+    return flags
+
 def holiday(df):
     """
     1 if Opening Day (first home game of the year), July 4th (in US), Labor Day, Memorial Day, Canada day (in Canada)
     """
-    holidays = set()
-    with open("holidays.csv", encoding='utf-8-sig') as fp:
-        reader = csv.DictReader(fp)
-        for r in reader:
-            dt = datetime.strptime(r['date'], '%m/%d/%Y').date()
-            holidays.add((dt, r['home_team']))
-
-    for r in df:
-        r['holiday'] = (r['date'], r['home_team']) in holidays
+    flags = holiday_flags([r['date'] for r in df], [r['home_team'] for r in df])
+    for r, flag in zip(df, flags.tolist()):
+        r['holiday'] = flag
         
+def load_rivalries():
+    """
+    set of (visiting_team, home_team) rivalry matchups from external integration
+    """
+    frame = read_integration('rivalries')
+    return set(zip(frame['visiting_team'].tolist(), frame['home_team'].tolist()))
+
 def rivalry(df):
     """
     1 if the game is between local/historic rivals.
     For instance 2 teams from the same city or the famous New York Yankees vs Boston Red Sox
     get from external integration.
     """
-    rivalries = set()
-    with open("rivalries.csv", encoding='utf-8-sig') as fp:
-        reader = csv.DictReader(fp)
-        for r in reader:
-            rivalries.add((r['visiting_team'], r['home_team']))
-
-    for r in df:
-        r['rivalry'] = ((r['visiting_team'], r['home_team'])) in rivalries
+    lookup = compile_lookup({pair: True for pair in load_rivalries()}, bool, ordinal=False)
+    flags, _ = gather(lookup, [r['visiting_team'] for r in df], [r['home_team'] for r in df])
+    for r, flag in zip(df, flags.tolist()):
+        r['rivalry'] = flag
 
 def get_condition_score(conditions, percip):
     """
@@ -229,6 +344,35 @@ defaults = { #domed stadiums. if the conditions are missing, default to 0.
     ('MIN04', 'oondition_score'): 0,
 }
 
+def load_weather():
+    """
+    load weather data per (date, home_team) along with the populations used to fill in missing values
+    """
+    weather_data = {} # to hold weather data per game
+    norm = defaultdict(list) # use means (per team, month) for missing values
+    frame = read_integration('weather')
+    for r in frame[['date', 'home', 'temp', 'wind_speed', 'conditions', 'percip']].to_dict('records'):
+        dt = r['date']
+        condition_score = get_condition_score(r['conditions'], r['percip'])
+
+        # missing values are read as nan
+        r['temp'] = int(r['temp']) if r['temp'] == r['temp'] else None
+        r['wind_speed'] = int(r['wind_speed']) if r['wind_speed'] == r['wind_speed'] else None
+
+        weather_data[dt, r['home']] = {'temp': r['temp'],
+                                       'wind': r['wind_speed'],
+                                       'condition_score': condition_score}
+        if r['temp'] is not None:
+            norm['temp', month(dt), r['home']].append(r['temp'])
+            norm['temp'].append(r['temp'])
+        if r['wind_speed'] is not None:
+            norm['wind', month(dt), r['home']].append(r['wind_speed'])
+            norm['wind'].append(r['wind_speed'])
+        if condition_score is not None:
+            norm['condition_score', month(dt), r['home']].append(condition_score)
+            norm['condition_score'].append(condition_score)
+    return weather_data, norm
+
 def weather(df):
     """
     weather exxternal integration.
@@ -236,30 +380,7 @@ def weather(df):
     wind: wind speed (mph) at the start of the game in the stadium. If the stadium is domed wind=0
     condition_score: enumeration of weather condition. no clouds/in dome=0, cloudy/overcast=1, rain=3-5,snow/hail=7
     """
-    weather_data = {} # to hold weather data per game
-    norm = defaultdict(list) # use means (per team, month) for missing values
-    with open("weather.csv") as fp:
-        reader = csv.DictReader(fp)
-        for r in reader:
-            dt = datetime.strptime(r['date'],'%m/%d/%Y').date()
-            condition_score = get_condition_score(r['conditions'], r['percip'])
-
-            #convert data from strings
-            r['temp'] = int(r['temp']) if r['temp'] != 'null' else None
-            r['wind_speed'] = int(r['wind_speed']) if r['wind_speed'] != 'null' else None
-
-            weather_data[dt, r['home']] = {'temp': r['temp'],
-                                                  'wind': r['wind_speed'],
-                                                  'condition_score': condition_score}
-            if r['temp'] is not None:
-                norm['temp', month(dt), r['home']].append(r['temp'])
-                norm['temp'].append(r['temp'])
-            if r['wind_speed'] is not None:
-                norm['wind', month(dt), r['home']].append(r['wind_speed'])
-                norm['wind'].append(r['wind_speed'])
-            if condition_score is not None:
-                norm['condition_score', month(dt), r['home']].append(condition_score)
-                norm['condition_score'].append(condition_score)
+    weather_data, norm = load_weather()
 
     for r in df:
         for metric in ['temp', 'wind', 'condition_score']:
@@ -339,7 +460,52 @@ def get_stats(player_data,date,vis_team,home_team,player,pos):
             #print("{dt},{vs}-{home}: unable to locate {pl}".format(dt=date, vs=vis_team, home=home_team,pl=player))
             return [None]*4 # player is missing
 
-def player_stats(df):
+def load_player_ranks(frame, player_data):
+    """
+    add rows of game_ranks.csv (a typed chunk, see ingest.integrations) to the player stat data structure
+    """
+    columns = ('date', 'visiting_team', 'home_team', 'player_name', 'slg', 'ops', 'era', 'wpa', 'isPitcher')
+    values = (frame[c].tolist() if c in frame else [np.nan] * len(frame) for c in columns) # stats that weren't read are missing
+    for date, vis_team, home_team, player_name, slg, ops, era, wpa, is_pitcher in zip(*values):
+        date = str(date)
+        slg, ops, era, wpa = (value if value == value else None for value in (slg, ops, era, wpa)) # missing stats are read as nan
+        player_name=' '.join(player_name.split('_'))
+        player_last_name = player_name.split(' ')[-1]
+        player_data[(date,teams[vis_team],teams[home_team],is_pitcher)][player_name] = [slg, ops, era, wpa]
+        player_data[(date, teams[vis_team], teams[home_team],is_pitcher)][player_last_name] = [slg, ops, era, wpa]
+
+def player_rank_chunks(pitchers_only=False, chunksize=100000):
+    """
+    typed chunks of game_ranks.csv.
+    pitchers_only: only read the pitchers' rows and the columns needed for their wpa
+    """
+    usecols = ['date', 'visiting_team', 'home_team', 'player_name', 'wpa', 'isPitcher'] if pitchers_only else None
+    for chunk in read_integration_chunks('game_ranks', chunksize, usecols=usecols):
+        yield chunk[chunk['isPitcher'] == '1'] if pitchers_only else chunk
+
+def player_ranks_by_day(pitchers_only=False, chunksize=100000):
+    """
+    stream the (date ordered) player stat file one day at a time.
+    yields (date string, player stat data structure holding only that day's rows)
+    """
+    day, player_data = None, None
+    for chunk in player_rank_chunks(pitchers_only, chunksize):
+        dates = [str(dt) for dt in chunk['date'].tolist()]
+        for n, (date, rows) in enumerate(groupby(range(len(dates)), key=dates.__getitem__)):
+            rows = list(rows)
+            if date != day:
+                if day is not None:
+                    if date < day:
+                        raise ValueError("game_ranks.csv is not sorted by date ({} after {})".format(date, day))
+                    yield day, player_data
+                day, player_data = date, defaultdict(dict)
+            elif n > 0: # only the first day of a chunk may continue the previous chunk
+                raise ValueError("game_ranks.csv is not sorted by date ({} after {})".format(date, day))
+            load_player_ranks(chunk.iloc[rows[0]:rows[-1] + 1], player_data)
+    if day is not None:
+        yield day, player_data
+
+def player_stats(df, streaming=False, ledger=None, lineups=None):
     """
     integrate player offensive/defensive stats. calculate and normalize max, avergae stats per team.
     slg: season start-to-date Slugging percentage of the offensive players in the lineup. A popular in-game metric
@@ -350,126 +516,140 @@ def player_stats(df):
         A complex in-game metric for assesing how much the pitcher helped/ruined the team's chance of winning a game.
     era: season start-to-date Earned Run Average of the starting pitcher.
         A popular in-game metric for assesing the quality of a pitcher.
-    """
-    skip_header=True
-    player_data = defaultdict(dict)
-    with open("game_ranks.csv") as fp:
-        reader = csv.reader(fp)
-        for row in reader:
-            if skip_header:
-                skip_header = False
-            else:
-                date, vis_team, home_team, player_id, player_name, slg, ops, era, wpa, is_pitcher,yy = row
-                slg = float(slg) if slg != '' else None
-                ops = float(ops) if ops != '' else None
-                era = float(era) if era != '' else None
-                wpa = float(wpa) if wpa != '' else None
-                player_name=' '.join(player_name.split('_'))
-                player_last_name = player_name.split(' ')[-1]
-                player_data[(date,teams[vis_team],teams[home_team],is_pitcher)][player_name] = [slg, ops, era, wpa]
-                player_data[(date, teams[vis_team], teams[home_team],is_pitcher)][player_last_name] = [slg, ops, era, wpa]
-
-    games = defaultdict(dict)
-    norm = defaultdict(list)
-
-    for r in df:
-        for team in ['visiting', 'home']:
-            if int(r['number_of_game']) < 2:
-
-                date = r['date']
-                pitcher = r[team+'_pitcher_name'].lower()
-                players = [r[team+'_player{}_name'.format(i)].lower() for i in range(1,10)]
-
-                games[(date, r[team+'_team'])]['pitcher'] = get_stats(player_data,date,r['visiting_team'],r['home_team'],pitcher,'1')
-                games[(date, r[team+'_team'])]['positions'] = [get_stats(player_data,date,r['visiting_team'],r['home_team'],pl,'0') for pl in players]
-                try:
-                    pitcher = games[(date,r[team+'_team'])]['pitcher']
-                    if pitcher[2]: norm['era',r['season']].append(pitcher[2])
-                    if pitcher[3]: norm['wpa',r['season']].append(pitcher[3])
-                except:
-                    print((date,r[team+'_team'],'pitcher'))
-                try:
-                    pos = games[(date, r[team + '_team'])]['positions']
-                    norm['slg',r['season']].extend([pos[p][0] for p in range(9) if pos[p] and pos[p][0]])
-                    norm['ops',r['season']].extend([pos[p][1] for p in range(9) if pos[p] and pos[p][1]])
-                except:
-                    print((date, r[team + '_team'], 'positions'))
-    norm_cache = {}
-    for i,r in enumerate(df):
-        for team in ['home_team', 'visiting_team']:
-            if int(r[team+'_game_number']) > 10:
-                players = games[r['date'], r[team]]
-
-                r[team+'_starter_era_normalized'] = normalize(norm['era',r['season']], players['pitcher'][2], norm_cache, ('era',r['season']))
-                r[team+'_starter_wpa_normalized'] = normalize(norm['wpa',r['season']], players['pitcher'][3], norm_cache, ('wpa',r['season']))
-
-                normalized_ops = [normalize(norm['ops', r['season']], p[1], norm_cache, ('ops', r['season'])) for p in players['positions'] if p]
-                normalized_slg = [normalize(norm['slg', r['season']], p[0], norm_cache, ('slg', r['season'])) for p in players['positions'] if p]
-                try:
-                    r[team+'_max_slg_normalized'] = max(normalized_slg)
-                except ValueError:
-                    r[team + '_max_slg_normalized'] = 0
-                try:
-                    r[team + '_max_ops_normalized'] = max(normalized_ops)
-                except ValueError:
-                    r[team + '_max_ops_normalized'] = 0
-                try:
-                    r[team + '_avg_slg_normalized'] = mean(normalized_slg)
-                except ValueError:
-                    r[team + '_avg_slg_normalized'] = 0
-                try:
-                    r[team + '_avg_ops_normalized'] = mean(normalized_ops)
-                except ValueError:
-                    r[team + '_avg_ops_normalized'] = 0
-            else:
-                r[team + '_max_slg_normalized'] = 0
-                r[team + '_max_ops_normalized'] = 0
-                r[team + '_avg_slg_normalized'] = 0
-                r[team + '_avg_ops_normalized'] = 0
-                r[team + '_starter_era_normalized'] = 0
-                r[team + '_starter_wpa_normalized'] = 0
-
-
-def salary(df):
+    streaming: merge-join the player stat file with the game log by date instead of loading it into memory.
+        only the current day's player stats are held at a time. both files must be sorted by date.
+    ledger: PlayerLedger (see ledger.py). if given, slg, ops and era are computed from the players' box score lines
+        before the game instead of the scraped stats, matched by player id. wpa still comes from game_ranks.csv,
+        of which only the pitchers' rows are read
+    lineups: lineup matrix of df (lineups.lineup_matrix), built from df if not given
+    """
+    if streaming:
+        days = player_ranks_by_day(pitchers_only=ledger is not None)
+        ranks_date, ranks_data = next(days, (None, None))
+        day = None
+    else:
+        player_data = defaultdict(dict)
+        for chunk in player_rank_chunks(pitchers_only=ledger is not None):
+            load_player_ranks(chunk, player_data)
+
+    if lineups is None:
+        lineups = lineup_matrix(df)
+    position_stats = np.full(lineups.players.shape + (2,), np.nan) # slg, ops per game / team / lineup slot
+    pitcher_stats = np.full(lineups.pitchers.shape + (2,), np.nan) # era, wpa per game / team
+    first_game = {} # (date, team) -> row of the team's first game that day. doubleheaders use the first game's lineup
+
+    for g, r in enumerate(df):
+        if streaming and r['date'] != day:
+            if day is not None and r['date'] < day:
+                raise ValueError("streaming requires the game log to be sorted by date ({} after {})".format(r['date'], day))
+            day = r['date']
+            while ranks_date is not None and ranks_date < str(day): # skip days without games in the game log
+                ranks_date, ranks_data = next(days, (None, None))
+            player_data = ranks_data if ranks_date == str(day) else {}
+
+        if int(r['number_of_game']) < 2:
+            for t, team in enumerate(sides):
+                first_game[r['date'], r[team+'_team']] = g, t
+                pitcher = lineups.names[lineups.pitcher_names[g, t]]
+                pitcher_stats[g, t] = get_stats(player_data,r['date'],r['visiting_team'],r['home_team'],pitcher,'1')[2:]
+                if ledger is not None: # slg / ops come from the ledger
+                    continue
+                for i, player in enumerate(lineups.player_names[g, t]):
+                    position_stats[g, t, i] = get_stats(player_data,r['date'],r['visiting_team'],r['home_team'],lineups.names[player],'0')[:2]
+    if streaming:
+        days.close()
+
+    if ledger is not None:
+        dates = [r['date'] for r in df]
+        batting = ledger.season_to_date([lineups.ids[code] for code in lineups.players.reshape(-1).tolist()],
+                                        [dt for dt in dates for _ in range(18)])
+        position_stats[..., 0] = batting['slg'].reshape(lineups.players.shape)
+        position_stats[..., 1] = batting['ops'].reshape(lineups.players.shape)
+        pitching = ledger.season_to_date([lineups.ids[code] for code in lineups.pitchers.reshape(-1).tolist()],
+                                         [dt for dt in dates for _ in range(2)])
+        pitcher_stats[..., 0] = pitching['era'].reshape(lineups.pitchers.shape)
+
+    # normalize against all (non zero) stats of first games in the season
+    seasons = np.array([r['season'] for r in df])
+    first = np.array([int(r['number_of_game']) < 2 for r in df])
+    norm = {}
+    for k, metric, values in ((0, 'slg', position_stats), (1, 'ops', position_stats), (0, 'era', pitcher_stats), (1, 'wpa', pitcher_stats)):
+        norm[metric] = {}
+        for season in set(seasons.tolist()):
+            pop = values[first & (seasons == season)][..., k].reshape(-1)
+            norm[metric][season] = pop[~np.isnan(pop) & (pop != 0)]
+
+    # (row, team) the stats of every game / team are taken from
+    source = np.array([[first_game.get((r['date'], r[team+'_team']), (g, t)) for t, team in enumerate(sides)] for g, r in enumerate(df)])
+    position_stats = position_stats[source[..., 0], source[..., 1]] # (games, 2, 9, 2)
+    pitcher_stats = pitcher_stats[source[..., 0], source[..., 1]] # (games, 2, 2)
+
+    features = {}
+    for k, metric in ((0, 'slg'), (1, 'ops')):
+        m, sd = season_stats(seasons, norm[metric])
+        normalized = np.nan_to_num(normalize_array(position_stats[..., k], m[:, None, None], sd[:, None, None]))
+        occupied = np.ones(normalized.shape, dtype=bool) # players with missing stats count as average (0)
+        features['max_' + metric] = masked_max(normalized, occupied)
+        features['avg_' + metric] = masked_mean(normalized, occupied)
+    for k, metric in ((0, 'era'), (1, 'wpa')):
+        m, sd = season_stats(seasons, norm[metric])
+        features['starter_' + metric] = np.nan_to_num(normalize_array(pitcher_stats[..., k], m[:, None], sd[:, None]))
+
+    for g, r in enumerate(df):
+        for t, team in enumerate(sides):
+            for feature, values in features.items():
+                # don't calculate this field if there haven't been enough games played this season. not enough data
+                r['{}_team_{}_normalized'.format(team, feature)] = float(values[g, t]) if int(r[team+'_team_game_number']) > 10 else 0
+
+
+def salary(df, lineups=None):
     """
     average player yearly salary for each player in the starting lineup.
     Player salaries are an indicator for how much an organization expects for a player to drive revenues - a part of which are generated from attendance
+    lineups: lineup matrix of df (lineups.lineup_matrix), built from df if not given
     """
     salaries = {}
     salaries_by_last_name = defaultdict(dict)
     norm = defaultdict(list)
-    with open("salaries_integration.csv", encoding='utf-8-sig') as fp:
-        reader = csv.DictReader(fp)
-        for r in reader:
-            salary = int(r['salary'])
-            player = player_outliers.get(r['player'], r['player'])
-            salaries[r['season'], r['team'], player] = salary
-            salaries_by_last_name[int(r['season']), r['team'], player.split()[-1]] = salary
-            norm[int(r['season'])].append(salary)
-
-    def find_player_salary(record, team, player):
-        return salaries.get((record['season'], record[team+'_team'], player.lower()),
-                      salaries_by_last_name.get((record['season'], record[team+'_team'], player.lower().split()[-1]),0))
-    norm_cache = {}
-    for r in df:
-        for team in ('home', 'visiting'):
-            starting_pitcher_salary = find_player_salary(r, team, r['{}_pitcher_name'.format(team)])
-            lineup_salaries = []
-            for i in range(1,10):
-                player = r['{}_player{}_name'.format(team, i)]
-                sal = find_player_salary(r, team, player)
-                if sal:
-                    normalized_salary = normalize(norm[r['season']],sal, norm_cache, r['season'])
-                    lineup_salaries.append(normalized_salary)
-
-            r[team + '_max_salary_normalized'] = max(lineup_salaries)
-            r[team + '_avg_salary_normalized'] = mean(lineup_salaries)
-            if starting_pitcher_salary:
-                normalized_starting_pitcher_salary = normalize(norm[r['season']],starting_pitcher_salary, norm_cache, r['season'])
-                r[team+'_starter_salary_normalized'] = normalized_starting_pitcher_salary
-            else:
-                r[team+'_starter_salary_normalized'] = 0
-                
+    frame = read_integration('salaries')
+    for r in frame.to_dict('records'):
+        salary = r['salary']
+        player = player_outliers.get(r['player'], r['player'])
+        salaries[r['season'], r['team'], player] = salary
+        salaries_by_last_name[r['season'], r['team'], player.split()[-1]] = salary
+        norm[r['season']].append(salary)
+
+    def find_player_salary(season, team, player):
+        salary = salaries.get((season, team, player),
+                              salaries_by_last_name.get((season, team, player.split()[-1]),0))
+        return salary or None # no salary data for this player
+
+    if lineups is None:
+        lineups = lineup_matrix(df)
+    team_names = sorted(set(r[team+'_team'] for r in df for team in sides))
+    team_codes = np.array([[team_names.index(r[team+'_team']) for team in sides] for r in df])
+    seasons = np.array([r['season'] for r in df])
+
+    def lookup(season, team, name):
+        return find_player_salary(season, team_names[team], lineups.names[name])
+
+    # players are looked up by the name in each game's row
+    lineup_salaries = resolve(np.stack(np.broadcast_arrays(seasons[:, None, None], team_codes[:, :, None], lineups.player_names), axis=-1), lookup)
+    starter_salaries = resolve(np.stack(np.broadcast_arrays(seasons[:, None], team_codes, lineups.pitcher_names), axis=-1), lookup)
+
+    m, sd = season_stats(seasons, norm)
+    normalized_lineup = normalize_array(lineup_salaries, m[:, None, None], sd[:, None, None])
+    found = ~np.isnan(lineup_salaries) # only players with salary data
+    max_salary = masked_max(normalized_lineup, found)
+    avg_salary = masked_mean(normalized_lineup, found)
+    starter_salary = np.where(np.isnan(starter_salaries), 0, normalize_array(starter_salaries, m[:, None], sd[:, None]))
+
+    for g, r in enumerate(df):
+        for t, team in enumerate(sides):
+            r[team + '_max_salary_normalized'] = float(max_salary[g, t])
+            r[team + '_avg_salary_normalized'] = float(avg_salary[g, t])
+            r[team + '_starter_salary_normalized'] = float(starter_salary[g, t])
+
 
 def standings(df):
     """
@@ -595,56 +775,186 @@ def contention_score(df):
                 # use p(X >= Y) = Sigma_(k=[0,n]) p(X >= k)*p(X = k)
                 r[team+'_contention_score'] = sum(bin_gt(gr,pct,max(k+gb,0))*bin(contender_gr,contender_pct,k) for k in range(0,min(gr,contender_gr)+1))
 
+def simulate_division(wins, played, samples, rng, prior_games=30, max_block=10**7):
+    """
+    probability of each team finishing first in its division.
+    wins, played: (days, teams) arrays holding the division standings at the start of each game day.
+    every team's remaining games are drawn at once for all days as Bin(games remaining, p), where p is the win pct
+    shrunk toward .500 by prior_games pseudo-games: (wins + prior_games * 0.5) / (played + prior_games).
+    ties for first place are split evenly between the tied teams.
+    """
+    pct = np.divide(wins + prior_games * 0.5, played + prior_games, out=np.full(wins.shape, 0.5),
+                    where=played + prior_games > 0)
+    remaining = np.maximum(162 - played, 0)
+    odds = np.empty(wins.shape)
+    block = max(1, max_block // (samples * wins.shape[1])) # number of days to simulate at once (bounds memory)
+    for start in range(0, wins.shape[0], block):
+        days = slice(start, start + block)
+        final = wins[days] + rng.binomial(remaining[days], pct[days], size=(samples,) + wins[days].shape)
+        leaders = final == final.max(axis=2, keepdims=True)
+        odds[days] = (leaders / leaders.sum(axis=2, keepdims=True)).mean(axis=0)
+    return odds
+
+def playoff_odds(df, samples=1000, seed=0, prior_games=30):
+    """
+    probability of reaching the playoffs (finishing first in the division) prior to the game.
+    unlike contention_score, which only compares a team against a single contender, this simulates the rest of
+    the season for every team in the division (monte carlo, see simulate_division).
+    assumes a team keeps winning at its current pct regressed toward .500: the raw pct of a 3-0 or 0-3 start would
+    settle the division in every simulated season (odds of exactly 0 / 1). prior_games is the weight of the .500
+    prior in games - early in the season the odds stay near even, late in the season the record dominates.
+    like contention_score, the odds default to 0.5 for a team's first 10 games of the season.
+    samples: number of simulated seasons per game day. the error is ~0.5/sqrt(samples): 1000 samples -> +-0.016,
+        10000 samples -> +-0.005 at 10 times the run time.
+    """
+    rng = np.random.default_rng(seed)
+    current = defaultdict(lambda: defaultdict(lambda: [0, 0])) # holds (wins, games played) per season / team up until a given point in time
+    snapshots = defaultdict(list) # standings at the start of each game day, by season
+    day_index = {} # (season, date) -> index of the game day in the season's snapshots
+    division_teams = defaultdict(set) # teams by season, league, division
 
-def ticket_price(df):
+    for r in df:
+        season = r['season']
+        if (season, r['date']) not in day_index:
+            day_index[season, r['date']] = len(snapshots[season])
+            snapshots[season].append({team: tuple(record) for team, record in current[season].items()})
+
+        for team in ('home_team', 'visiting_team'):
+            division_teams[season, r[team+'_league'], r[team+'_division']].add(r[team])
+            current[season][r[team]][1] += 1
+            if r['winning_team'] == r[team]:
+                current[season][r[team]][0] += 1
+
+    odds = {} # (season, team) -> array of odds per game day
+    for (season, league, division), teams in division_teams.items():
+        teams = sorted(teams)
+        standings = np.array([[day.get(team, (0, 0)) for team in teams] for day in snapshots[season]])
+        division_odds = simulate_division(standings[:, :, 0], standings[:, :, 1], samples, rng, prior_games)
+        for i, team in enumerate(teams):
+            odds[season, team] = division_odds[:, i]
+
+    for r in df:
+        for team in ('home_team', 'visiting_team'):
+            if r[team+'_game_number'] <= 10: # not enough games played in the season. default to 0.5, like contention_score
+                r[team+'_playoff_odds'] = 0.5
+            else:
+                r[team+'_playoff_odds'] = odds[r['season'], r[team]][day_index[r['season'], r['date']]]
+
+
+def load_ticket_prices():
     """
-    average regular game ticket price (USD not adjusted for inflation) for that team/season.
-    Normalized against average ticket prices for all teams in each season
+    average ticket price per (season, team) and all prices per season to normalize against
     """
     prices = {}
     norm = defaultdict(list) # all values to be used to normalize the feature
 
-    with open("ticket_prices.csv", encoding='utf-8-sig') as fp:
-        reader = csv.DictReader(fp)
-        for r in reader:
-            for season, price in r.items():
-                if season != 'team' and price != '':
-                    prices[int(season), r['team']] = float(price)
-                    norm[int(season)].append(float(price))
+    frame = read_integration('ticket_prices')
+    for r in frame.to_dict('records'):
+        for season, price in r.items():
+            if season != 'team' and price == price: # missing prices are read as nan
+                prices[int(season), r['team']] = float(price)
+                norm[int(season)].append(float(price))
+    return prices, norm
 
-    norm_cache = {}
-    for r in df:
-        #normalize against all ticket prices for that season.
-        r['avg_ticket_price_normalized'] = normalize(norm[r['season']],prices[r['season'],r['home_team']], norm_cache, r['season'])
+def ticket_price_normalized(seasons, home_teams, change=0):
+    """
+    home team's ticket price for every game, normalized against all ticket prices for that season.
+    change: relative change of the home team's price (0.1 = +10%). the prices normalized against stay unchanged
+    """
+    prices, _ = load_ticket_prices()
+    lookup = compile_lookup(prices, np.float64)
+    price, _ = gather(lookup, seasons, home_teams, 'ticket_price')
+    season_mean, season_std = row_stats(lookup)
+    offsets = np.asarray(seasons) - lookup.first
+    m, s = season_mean[offsets], season_std[offsets]
+    price = price * (1 + np.asarray(change, dtype=float))
+    return np.divide(price - m, s, out=np.zeros(price.shape), where=s != 0)
+
+def ticket_price(df):
+    """
+    average regular game ticket price (USD not adjusted for inflation) for that team/season.
+    Normalized against average ticket prices for all teams in each season
+    """
+    normalized = ticket_price_normalized([r['season'] for r in df], [r['home_team'] for r in df])
+    for r, price in zip(df, normalized.tolist()):
+        r['avg_ticket_price_normalized'] = price
 
-def player_age(df):
+def player_age(df, streaming=False):
     """
     player age = total number of games to date a player has appeared in an opening lineup.
     Normalized against player ages for all players/games.
     "Veteran" players have better name recoginition, tend to be bigger "stars" and become team icons if the have been with the team for a long time
+    streaming: merge-join the 1970-2017 game logs with the game log by date instead of loading all ages into memory.
+        only the current day's ages and the running per-player counts are held at a time. both files must be sorted by date.
     """
     current_ages = defaultdict(int) # holds the metric count per player up until a given point in time
     ages = {} # holds age metrics (mean,max) for each team / game
     norm = {'avg': [], 'max': []}
-    with open("all_players1970_2017.csv") as fp: # load game logs 1970-2017
-        reader = csv.DictReader(fp)
-        for r in reader:
-            dt = max(datetime.strptime(r['date'],'%m/%d/%Y').date(),date(1990,1,1)) # don't care about individual game data before 1990
-            for team in ('home', 'visiting'):
-                if dt > date(1990, 1, 1):
-                    current_team_ages = [current_ages[r['{}_player{}_id'.format(team,i)]] for i in range(1,10)] #get current age for each player in lineup
-                    current_team_age_mean = mean(current_team_ages)
-                    current_team_age_max = max(current_team_ages)
-                    ages[dt, r[team+'_team'], 'avg'] = current_team_age_mean
-                    ages[dt, r[team+'_team'], 'max'] = current_team_age_max
-                    norm['avg'].append(current_team_age_mean)
-                    norm['max'].append(current_team_age_max)
-                for i in range(1,10):
-                    current_ages[r['{}_player{}_id'.format(team,i)]]+=1 # update ages for all players in this game's lineup
+
+    def add_game(r):
+        dt = max(r['date'],date(1990,1,1)) # don't care about individual game data before 1990
+        for team in ('home', 'visiting'):
+            if dt > date(1990, 1, 1):
+                current_team_ages = [current_ages[r['{}_player{}_id'.format(team,i)]] for i in range(1,10)] #get current age for each player in lineup
+                current_team_age_mean = mean(current_team_ages)
+                current_team_age_max = max(current_team_ages)
+                ages[dt, r[team+'_team'], 'avg'] = current_team_age_mean
+                ages[dt, r[team+'_team'], 'max'] = current_team_age_max
+                norm['avg'].append(current_team_age_mean)
+                norm['max'].append(current_team_age_max)
+            for i in range(1,10):
+                current_ages[r['{}_player{}_id'.format(team,i)]]+=1 # update ages for all players in this game's lineup
+        return dt
+
+    # game logs 1970-2017
+    reader = (r for chunk in read_integration_chunks('all_players') for r in chunk.to_dict('records'))
+    if not streaming:
+        games = [] # (date, home team, visiting team) of every game in the file
+
+        def read_games():
+            for r in reader:
+                games.append((max(r['date'],date(1990,1,1)), r['home_team'], r['visiting_team'])) # don't care about individual game data before 1990
+                yield r
+
+        lineups = lineup_matrix(read_games())
+        counts = appearance_counts(lineups.players[:, ::-1])[:, ::-1] # age of every player prior to the game. home lineups are counted first
+        mean_ages, max_ages = counts.mean(axis=2), counts.max(axis=2)
+        for g, (dt, home_team, visiting_team) in enumerate(games):
+            if dt > date(1990, 1, 1):
+                for t, team in ((1, home_team), (0, visiting_team)):
+                    ages[dt, team, 'avg'] = mean_ages[g, t]
+                    ages[dt, team, 'max'] = max_ages[g, t]
+                    norm['avg'].append(mean_ages[g, t])
+                    norm['max'].append(max_ages[g, t])
+        team_ages = [(ages[r['date'], r[team], 'avg'], ages[r['date'], r[team], 'max'])
+                     for r in df for team in ('home_team', 'visiting_team')]
+    else:
+        team_ages = [] # raw (mean,max) per game / team, normalized once all games have been seen
+        pending = next(reader, None)
+        last_dt = date.min
+        day = None
+        for r in df:
+            if r['date'] != day:
+                if day is not None and r['date'] < day:
+                    raise ValueError("streaming requires the game log to be sorted by date ({} after {})".format(r['date'], day))
+                day = r['date']
+                ages.clear() # only keep the current day's ages
+                while pending is not None and pending['date'] <= day:
+                    dt = add_game(pending)
+                    if dt < last_dt:
+                        raise ValueError("all_players1970_2017.csv is not sorted by date ({} after {})".format(dt, last_dt))
+                    last_dt = dt
+                    pending = next(reader, None)
+            for team in ('home_team', 'visiting_team'):
+                team_ages.append((ages[r['date'], r[team], 'avg'], ages[r['date'], r[team], 'max']))
+        while pending is not None: # remaining games are still part of the normalization population
+            add_game(pending)
+            pending = next(reader, None)
 
     norm_cache = {}
+    team_ages = iter(team_ages)
     for r in df:
         for team in ('home_team', 'visiting_team'):
-            r[team+'_average_player_age_normalized'] = normalize(norm['avg'], ages[r['date'], r[team], 'avg'], norm_cache, 'avg')
-            r[team+'_max_player_age_normalized'] = normalize(norm['max'], ages[r['date'], r[team], 'max'], norm_cache, 'max')
-
+            avg_age, max_age = next(team_ages)
+            r[team+'_average_player_age_normalized'] = normalize(norm['avg'], avg_age, norm_cache, 'avg')
+            r[team+'_max_player_age_normalized'] = normalize(norm['max'], max_age, norm_cache, 'max')
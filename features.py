@@ -0,0 +1,99 @@
+"""
+feature registry: every feature function with the columns it adds to the game table and the columns it reads
+that other features produce (game log columns are always available).
+compute(df, columns) runs only the feature functions - and so reads only the reference files - needed for the
+requested columns and their dependencies, e.g. contention_score -> standings -> divisions, loss_count.
+requesting a column that is neither produced by a feature nor in the game table raises a ValueError.
+"""
+from collections import namedtuple
+from functools import partial
+import feature_engineering as fe
+from lineups import sides, lineup_matrix
+
+# name: feature name (also the pipeline stage / checkpoint name)
+# func: feature function, called with the game table
+# produces: columns added to the game table
+# requires: columns read by func that are produced by other features
+Feature = namedtuple('Feature', ['name', 'func', 'produces', 'requires'])
+
+teams = ('visiting_team', 'home_team')
+
+def per_team(*templates, teams=teams):
+    return [template.format(team) for team in teams for template in templates]
+
+player_stat_features = ('max_slg', 'avg_slg', 'max_ops', 'avg_ops', 'starter_era', 'starter_wpa')
+
+registry = [ # in dependency order
+    Feature('divisions', fe.divisions, per_team('{}_division'), []),
+    Feature('loss_count', fe.loss_count, ['winning_team'] + per_team('{}_loss_count'), []),
+    Feature('park_capacity', fe.park_capacity, ['park_capacity'], []),
+    Feature('weather', fe.weather, ['temp', 'wind', 'condition_score'], []),
+    Feature('holiday', fe.holiday, ['holiday'], []),
+    Feature('rivalry', fe.rivalry, ['rivalry'], []),
+    Feature('interleague', fe.interleague, ['interleague'], []),
+    Feature('intradivision', fe.intradivision, ['is_intradivision'], per_team('{}_division')),
+] + [
+    Feature('cumulative_' + metric, partial(fe.cumulative_metric, metric=metric),
+            per_team('cumulative_{}_' + metric, 'cumulative_{}_' + metric + '_normalized'), [])
+    for metric in ('runs', 'hits', 'home_runs')
+] + [
+    Feature('streaks', fe.streaks, per_team('{}_streak'), ['winning_team']),
+    Feature('rolling_form', fe.rolling_form,
+            per_team(*['{{}}_last{}_{}{}'.format(w, metric, suffix) for metric in fe.rolling_metrics
+                       for w in fe.rolling_windows for suffix in ('', '_normalized')]),
+            ['winning_team']),
+    Feature('standings', fe.standings,
+            per_team('{}_rank_in_division', '{}_games_behind', '{}_contender_pct', '{}_contender_games_remaining'),
+            per_team('{}_division', '{}_loss_count')),
+    Feature('salary', fe.salary,
+            per_team('{}_max_salary_normalized', '{}_avg_salary_normalized', '{}_starter_salary_normalized', teams=sides), []),
+    Feature('player_stats', partial(fe.player_stats, streaming=True),
+            per_team(*['{}_' + feature + '_normalized' for feature in player_stat_features]), []),
+    Feature('contention_score', fe.contention_score, per_team('{}_contention_score'),
+            per_team('{}_loss_count', '{}_games_behind', '{}_contender_pct', '{}_contender_games_remaining')),
+    Feature('playoff_odds', fe.playoff_odds, per_team('{}_playoff_odds'), ['winning_team'] + per_team('{}_division')),
+    Feature('ticket_price', fe.ticket_price, ['avg_ticket_price_normalized'], []),
+    Feature('player_age', partial(fe.player_age, streaming=True),
+            per_team('{}_average_player_age_normalized', '{}_max_player_age_normalized'), []),
+]
+
+lineup_features = ('salary', 'player_stats') # take the lineup matrix of the game table (lineups=), build it once for both
+
+producers = {column: feature for feature in registry for column in feature.produces}
+
+def dependencies(feature):
+    """
+    names of the features producing the columns this feature reads
+    """
+    return sorted(set(producers[column].name for column in feature.requires))
+
+def plan(columns, available):
+    """
+    features needed to produce the given columns, in dependency order.
+    available: columns of the game table (game log header). they need no feature, any other column no feature
+    produces raises a ValueError
+    """
+    unknown = sorted(set(column for column in columns if column not in producers and column not in available))
+    if unknown:
+        raise ValueError("no feature produces {} and the game table has no such column(s)".format(unknown))
+    needed = set()
+    pending = [producers[column] for column in columns if column in producers]
+    while pending:
+        feature = pending.pop()
+        if feature.name not in needed:
+            needed.add(feature.name)
+            pending.extend(producers[column] for column in feature.requires)
+    return [feature for feature in registry if feature.name in needed]
+
+def compute(df, columns=None):
+    """
+    add the requested columns (all features if None) to the game table, running each needed feature once
+    """
+    features = registry if columns is None else plan(columns, df[0])
+    lineups = lineup_matrix(df) if any(feature.name in lineup_features for feature in features) else None
+    for feature in features:
+        if feature.name in lineup_features:
+            feature.func(df, lineups=lineups)
+        else:
+            feature.func(df)
+    return df
@@ -0,0 +1,153 @@
+"""
+chunked, typed csv ingestion for the game log and the external integration files.
+files are read in chunks straight into typed columns (small ints, categories), dates are parsed once per
+distinct date string and team renames are applied to the category codes instead of to every row.
+"""
+import numpy as np
+import pandas as pd
+from pandas.api.types import union_categoricals
+
+team_renames = {'FLO':'MIA', 'CAL':'ANA'} # teams that have changed names at some point
+
+game_log_dtypes = {
+    'season': 'int16',
+    'number_of_game': 'int8',
+    'day_of_week': 'category',
+    'visiting_team': 'category',
+    'visiting_team_league': 'category',
+    'visiting_team_game_number': 'int16',
+    'home_team': 'category',
+    'home_team_league': 'category',
+    'home_team_game_number': 'int16',
+    'visiting_team_runs': 'int16',
+    'home_team_runs': 'int16',
+    'visiting_team_hits': 'int16',
+    'visiting_team_home_runs': 'int16',
+    'home_team_hits': 'int16',
+    'home_team_home_runs': 'int16',
+    'game_time': 'category',
+    'park_id': 'category',
+}
+
+lineup_id_columns = ['{}_player{}_id'.format(team, i) for team in ('visiting', 'home') for i in range(1, 10)]
+
+integrations = { # typed schema per integration file
+    'divisions': {'file': 'divisions.csv', 'encoding': 'utf-8-sig',
+                  'dtypes': {'season': 'int16', 'team': 'category', 'division': 'category'}},
+    'park_capacities': {'file': 'park_capacities.csv', 'encoding': 'utf-8-sig',
+                        'dtypes': {'season': 'int16', 'park_id': 'category', 'park_capacity': 'int32'}},
+    'holidays': {'file': 'holidays.csv', 'encoding': 'utf-8-sig',
+                 'dtypes': {'home_team': 'category'}, 'dates': ['date']},
+    'rivalries': {'file': 'rivalries.csv', 'encoding': 'utf-8-sig',
+                  'dtypes': {'visiting_team': 'category', 'home_team': 'category'}},
+    'salaries': {'file': 'salaries_integration.csv', 'encoding': 'utf-8-sig',
+                 'dtypes': {'season': 'int16', 'team': 'category', 'player': 'str', 'salary': 'int32'}},
+    'ticket_prices': {'file': 'ticket_prices.csv', 'encoding': 'utf-8-sig',
+                      'dtypes': {'team': 'category'}},
+    'weather': {'file': 'weather.csv',
+                'dtypes': {'game_no': 'int8', 'vis': 'category', 'home': 'category', 'temp': 'float32',
+                           'wind_speed': 'float32', 'conditions': 'category', 'percip': 'category'},
+                'dates': ['date'], 'keep_default_na': False, 'na_values': {'temp': ['null'], 'wind_speed': ['null']}},
+    'game_ranks': {'file': 'game_ranks.csv',
+                   'dtypes': {'visiting_team': 'category', 'home_team': 'category', 'player_id': 'category',
+                              'player_name': 'str', 'slg': 'float64', 'ops': 'float64', 'era': 'float64',
+                              'wpa': 'float64', 'isPitcher': 'category'},
+                   'dates': ['date'], 'date_format': '%Y-%m-%d'},
+    'all_players': {'file': 'all_players1970_2017.csv', # only the columns player_age reads
+                    'usecols': ['date', 'visiting_team', 'home_team'] + lineup_id_columns,
+                    'dtypes': dict({'visiting_team': 'category', 'home_team': 'category'},
+                                   **{column: 'str' for column in lineup_id_columns}),
+                    'dates': ['date'], 'keep_default_na': False}, # missing player ids stay ''
+}
+
+def parse_dates(values, memo, date_format='%m/%d/%Y'):
+    """
+    convert a column of date strings to datetime.date objects.
+    only strings that are not already in memo are parsed, all at once
+    """
+    values = values.astype('category')
+    new = [dt for dt in values.cat.categories if dt not in memo]
+    if new:
+        memo.update(zip(new, pd.to_datetime(pd.Index(new), format=date_format).date))
+    return values.map(memo)
+
+def remap_teams(values):
+    """
+    apply team_renames to a team column by remapping its category codes
+    """
+    values = values.astype('category')
+    renamed = [team_renames.get(team, team) for team in values.cat.categories]
+    categories = pd.Index(renamed).unique()
+    lookup = np.append(categories.get_indexer(renamed), -1) # code -1 (missing value) stays missing
+    return pd.Series(pd.Categorical.from_codes(lookup[values.cat.codes.to_numpy()], categories), index=values.index)
+
+def read_chunks(path, dtypes=None, dates=(), teams=(), date_format='%m/%d/%Y', chunksize=100000, memo=None, **kwargs):
+    """
+    read a csv file in chunks of typed columns.
+    dates: columns parsed to datetime.date objects
+    teams: columns to apply team_renames to
+    memo: date string memo shared between chunks (and files)
+    """
+    memo = {} if memo is None else memo
+    dtypes = dict(dtypes or {})
+    for column in dates:
+        dtypes[column] = 'category' # parsed once per distinct value below
+    with pd.read_csv(path, dtype=dtypes, chunksize=chunksize, **kwargs) as reader:
+        for chunk in reader:
+            for column in dates:
+                chunk[column] = parse_dates(chunk[column], memo, date_format)
+            for column in teams:
+                chunk[column] = remap_teams(chunk[column])
+            yield chunk
+
+def concat_chunks(chunks):
+    """
+    concatenate typed chunks, keeping category columns as categories
+    """
+    chunks = list(chunks)
+    if not chunks:
+        return pd.DataFrame()
+    columns = {}
+    for column, dtype in chunks[0].dtypes.items():
+        parts = [chunk[column] for chunk in chunks]
+        if isinstance(dtype, pd.CategoricalDtype):
+            columns[column] = union_categoricals(parts)
+        else:
+            columns[column] = pd.concat(parts, ignore_index=True)
+    return pd.DataFrame(columns)
+
+def read_csv_typed(path, **kwargs):
+    """
+    read a whole csv file using read_chunks
+    """
+    return concat_chunks(read_chunks(path, **kwargs))
+
+def read_game_log(path="GL1990_2017.csv", usecols=None, chunksize=100000, memo=None):
+    """
+    game log with typed columns, dates as datetime.date objects and fixed team names.
+    replaces pd.read_csv + type_fix + fix_team_names
+    """
+    return read_csv_typed(path, dtypes=game_log_dtypes, dates=['date'], teams=['visiting_team', 'home_team'],
+                          usecols=usecols, chunksize=chunksize, memo=memo)
+
+def read_integration_chunks(name, chunksize=100000, memo=None, **kwargs):
+    """
+    read one of the external integration files by name (see integrations) in typed chunks.
+    kwargs: extra pd.read_csv arguments, e.g. usecols
+    """
+    schema = dict(integrations[name], **kwargs)
+    path = schema.pop('file')
+    return read_chunks(path, dtypes=schema.pop('dtypes'), dates=schema.pop('dates', ()),
+                       date_format=schema.pop('date_format', '%m/%d/%Y'), chunksize=chunksize, memo=memo, **schema)
+
+def read_integration(name, chunksize=100000, memo=None):
+    """
+    read a whole integration file by name (see integrations)
+    """
+    return concat_chunks(read_integration_chunks(name, chunksize, memo))
+
+def game_records(frame):
+    """
+    list of dicts (one per game) as expected by the feature functions
+    """
+    return frame.to_dict('records')
@@ -0,0 +1,115 @@
+"""
+player stat ledger: raw per-game counting stats (box score lines) of every player, from which rate stats
+(slg, obp, ops, era) are computed for any player over any date range.
+lines are stored sorted by (player, date) - one contiguous, date sorted segment per player - with prefix sums,
+so the totals between two dates are a binary search plus two prefix lookups (O(log n)), vectorized over queries.
+new box score lines are appended without rebuilding the history from the scraped rate stats.
+box score file (box_scores.csv): date (YYYY-MM-DD), player_id (game log / retrosheet id), ab, h, tb, bb, er, ip
+"""
+import csv
+from datetime import date
+import numpy as np
+
+stats = ('ab', 'h', 'tb', 'bb', 'er', 'outs') # counting stats, in column order. innings pitched are kept as outs
+
+def outs(ip):
+    """
+    innings pitched as written in box scores (6.1 = 6 1/3 innings) to outs
+    """
+    whole, _, thirds = str(ip).partition('.')
+    return int(whole or 0) * 3 + int(thirds or 0)
+
+class PlayerLedger:
+    """
+    ids: player id of every player code
+    keys: sorted int64 (player code << 32 | date ordinal) of every line
+    prefix: (lines + 1, stats) int64 prefix sums of the counting stats in key order
+    """
+    def __init__(self, ids=(), keys=None, prefix=None):
+        self.ids = list(ids)
+        self.codes = {player_id: code for code, player_id in enumerate(self.ids)}
+        self.keys = np.zeros(0, dtype=np.int64) if keys is None else keys
+        self.prefix = np.zeros((1, len(stats)), dtype=np.int64) if prefix is None else prefix
+
+    def __len__(self):
+        return len(self.keys)
+
+    def code(self, player_id):
+        if player_id not in self.codes:
+            self.codes[player_id] = len(self.ids)
+            self.ids.append(player_id)
+        return self.codes[player_id]
+
+    def append(self, lines):
+        """
+        add box score lines: iterable of (player id, date, {stat: value}). stats left out count as 0.
+        a player's lines may come in any order and dates can be earlier than the lines already in the ledger
+        """
+        keys, counts = [], []
+        for player_id, dt, line in lines:
+            keys.append(self.code(player_id) << 32 | dt.toordinal())
+            counts.append([line.get(stat, 0) for stat in stats])
+        if not keys:
+            return self
+        keys = np.concatenate([self.keys, np.array(keys, dtype=np.int64)])
+        counts = np.concatenate([np.diff(self.prefix, axis=0), np.array(counts, dtype=np.int64).reshape(-1, len(stats))])
+        order = np.argsort(keys, kind='stable')
+        self.keys = keys[order]
+        self.prefix = np.concatenate([np.zeros((1, len(stats)), dtype=np.int64), np.cumsum(counts[order], axis=0)])
+        return self
+
+    def totals(self, player_ids, starts, ends):
+        """
+        counting stat totals of each player over the games with start <= date < end.
+        player_ids: sequence of player ids. starts, ends: sequences of dates (or ordinals), same length.
+        returns a (queries, stats) int array. players that are not in the ledger have all zeros
+        """
+        codes = np.fromiter((self.codes.get(player_id, -1) for player_id in player_ids), dtype=np.int64, count=len(player_ids))
+        starts, ends = ordinals(starts), ordinals(ends)
+        known = codes >= 0
+        codes = np.where(known, codes, 0) << 32
+        lo = np.searchsorted(self.keys, codes | starts)
+        hi = np.searchsorted(self.keys, codes | ends)
+        return np.where(known[:, None], self.prefix[hi] - self.prefix[lo], 0)
+
+    def rates(self, player_ids, starts, ends):
+        """
+        rate stats of each player over the games with start <= date < end. NaN where there are no at bats / outs.
+        obp is computed from hits and walks only ((h + bb) / (ab + bb)), box score lines don't include hbp / sf
+        returns {'slg', 'obp', 'ops', 'era'}: float arrays
+        """
+        ab, h, tb, bb, er, out = self.totals(player_ids, starts, ends).T.astype(float)
+        slg = np.divide(tb, ab, out=np.full(ab.shape, np.nan), where=ab > 0)
+        obp = np.divide(h + bb, ab + bb, out=np.full(ab.shape, np.nan), where=ab + bb > 0)
+        era = np.divide(27 * er, out, out=np.full(ab.shape, np.nan), where=out > 0)
+        return {'slg': slg, 'obp': obp, 'ops': slg + obp, 'era': era}
+
+    def season_to_date(self, player_ids, dates):
+        """
+        rate stats of each player in the season up to (not including) the given date
+        """
+        return self.rates(player_ids, [date(dt.year, 1, 1) for dt in dates], dates)
+
+    def save(self, path):
+        np.savez(path, ids=np.array(self.ids, dtype=str), keys=self.keys, prefix=self.prefix)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            return cls(data['ids'].tolist(), data['keys'], data['prefix'])
+
+def ordinals(dates):
+    return np.array([dt if isinstance(dt, (int, np.integer)) else dt.toordinal() for dt in dates], dtype=np.int64)
+
+def box_score_lines(path="box_scores.csv"):
+    """
+    read the box score file as ledger lines
+    """
+    with open(path) as fp:
+        for r in csv.DictReader(fp):
+            line = {stat: int(r[stat] or 0) for stat in ('ab', 'h', 'tb', 'bb', 'er')}
+            line['outs'] = outs(r['ip'] or 0)
+            yield r['player_id'], date(*map(int, r['date'].split('-'))), line
+
+def load_ledger(path="box_scores.csv"):
+    return PlayerLedger().append(box_score_lines(path))
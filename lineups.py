@@ -0,0 +1,98 @@
+"""
+lineup matrix: the starting lineups of every game as integer player codes, built once from a game log.
+player lookups (salary, player stats, appearance counts) are gathered into (games x 2 teams x 9 slots) float
+arrays with NaN for missing values, and per-team max/avg features are masked reductions over the slot axis.
+"""
+from collections import namedtuple
+import numpy as np
+
+sides = ('visiting', 'home') # order of the team axis
+
+# players: (games, 2, 9) int array of player codes (by player id) of the starting lineups
+# pitchers: (games, 2) int array of starting pitcher codes
+# player_names, pitcher_names: name codes of the same slots, as spelled in each game's row
+# ids: player id of every player code
+# names: lower-cased name of every name code. games without player names (e.g. older game logs) have name None
+Lineups = namedtuple('Lineups', ['players', 'pitchers', 'player_names', 'pitcher_names', 'ids', 'names'])
+
+def lineup_matrix(df):
+    """
+    build the lineup matrix of a game log (any iterable of game records, read once)
+    """
+    codes, name_codes = {}, {}
+    ids, names = [], []
+    players, pitchers, player_names, pitcher_names = [], [], [], []
+
+    def code(r, field):
+        player_id = r.get(field + '_id')
+        if player_id not in codes:
+            codes[player_id] = len(ids)
+            ids.append(player_id)
+        return codes[player_id]
+
+    def name_code(r, field):
+        name = r.get(field + '_name')
+        name = name.lower() if isinstance(name, str) else None
+        if name not in name_codes:
+            name_codes[name] = len(names)
+            names.append(name)
+        return name_codes[name]
+
+    for r in df:
+        fields = [['{}_player{}'.format(side, i) for i in range(1, 10)] for side in sides]
+        players.append([[code(r, field) for field in side] for side in fields])
+        player_names.append([[name_code(r, field) for field in side] for side in fields])
+        pitchers.append([code(r, side + '_pitcher') for side in sides])
+        pitcher_names.append([name_code(r, side + '_pitcher') for side in sides])
+
+    def matrix(rows, shape):
+        return np.array(rows, dtype=np.int32).reshape(shape)
+
+    return Lineups(matrix(players, (-1, 2, 9)), matrix(pitchers, (-1, 2)),
+                   matrix(player_names, (-1, 2, 9)), matrix(pitcher_names, (-1, 2)), ids, names)
+
+def resolve(keys, lookup):
+    """
+    call lookup once for every distinct key and gather the results.
+    keys: int array whose last axis holds the key fields (e.g. season, team code, player code)
+    lookup: function of the key fields returning a number, or None if missing
+    returns a float array shaped keys.shape[:-1], NaN where the lookup is missing
+    """
+    flat = keys.reshape(-1, keys.shape[-1])
+    unique, inverse = np.unique(flat, axis=0, return_inverse=True)
+    values = np.array([lookup(*key) for key in unique.tolist()], dtype=float) # None -> nan
+    return values[inverse.reshape(-1)].reshape(keys.shape[:-1])
+
+def appearance_counts(players):
+    """
+    number of earlier lineups each player of a (games, 2, 9) lineup matrix has appeared in.
+    lineups are ordered by game, then team. a player listed twice in one lineup is counted once per listing,
+    but only after that lineup
+    """
+    flat = players.reshape(-1)
+    lineup = np.arange(len(flat)) // players.shape[-1]
+    order = np.argsort(flat, kind='stable') # groups the appearances of each player, in lineup order
+    player, lineup = flat[order], lineup[order]
+    positions = np.arange(len(flat))
+    new_player = np.r_[True, player[1:] != player[:-1]]
+    new_lineup = new_player | np.r_[True, lineup[1:] != lineup[:-1]]
+    player_start = np.maximum.accumulate(np.where(new_player, positions, 0))
+    lineup_start = np.maximum.accumulate(np.where(new_lineup, positions, 0))
+    counts = np.empty(len(flat), dtype=np.int64)
+    counts[order] = lineup_start - player_start
+    return counts.reshape(players.shape)
+
+def masked_max(values, mask, empty=0):
+    """
+    max over the slot (last) axis of the values where mask is True, empty if there are none
+    """
+    result = np.where(mask, values, -np.inf).max(axis=-1)
+    return np.where(mask.any(axis=-1), result, empty)
+
+def masked_mean(values, mask, empty=0):
+    """
+    mean over the slot (last) axis of the values where mask is True, empty if there are none
+    """
+    counts = mask.sum(axis=-1)
+    return np.divide(np.where(mask, values, 0).sum(axis=-1), counts,
+                     out=np.full(counts.shape, float(empty)), where=counts > 0)
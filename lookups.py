@@ -0,0 +1,81 @@
+"""
+dense numpy lookup tables for the external integrations.
+an integration keyed by (season, team), (season, park), (date, team) or (team, team) is compiled once into an
+array indexed by integer codes - season offset, team/park code or date ordinal - so enriching the whole game
+table is a single fancy-indexing gather instead of a dict probe per row.
+"""
+from collections import namedtuple
+import numpy as np
+from numpy import mean, std
+
+# values: dense array of the integration values, one axis per key
+# known: boolean array, True where the integration has an entry
+# first: season / date ordinal of the first row, None if the first key is coded like the second one
+# codes: (first key codes or None, second key codes)
+Lookup = namedtuple('Lookup', ['values', 'known', 'first', 'codes'])
+
+def vocabulary(keys):
+    return {key: code for code, key in enumerate(sorted(set(keys)))}
+
+def encode(keys, codes):
+    """
+    integer code of every key, -1 for keys that are not in codes
+    """
+    return np.fromiter((codes.get(key, -1) for key in keys), dtype=np.int64, count=len(keys))
+
+def compile_lookup(entries, dtype, ordinal=True):
+    """
+    compile {(first key, second key): value} into a Lookup.
+    ordinal: the first key is an integer (season, date ordinal) used as an offset. otherwise it is coded like the second key
+    """
+    firsts = [key[0] for key in entries]
+    second_codes = vocabulary(key[1] for key in entries)
+    if ordinal:
+        first = min(firsts)
+        first_codes = None
+        rows = np.array(firsts, dtype=np.int64) - first
+        shape = (max(firsts) - first + 1, len(second_codes))
+    else:
+        first = None
+        first_codes = vocabulary(firsts)
+        rows = encode(firsts, first_codes)
+        shape = (len(first_codes), len(second_codes))
+    columns = encode([key[1] for key in entries], second_codes)
+
+    values = np.zeros(shape, dtype=dtype)
+    known = np.zeros(shape, dtype=bool)
+    values[rows, columns] = np.array(list(entries.values()), dtype=dtype)
+    known[rows, columns] = True
+    return Lookup(values, known, first, (first_codes, second_codes))
+
+def gather(lookup, firsts, seconds, name=None):
+    """
+    look up every (first, second) key pair at once.
+    if name is given, keys without an entry raise a KeyError listing all of them (required integration),
+    otherwise they are returned as found=False.
+    returns (values, found)
+    """
+    first_codes, second_codes = lookup.codes
+    if first_codes is None:
+        rows = np.asarray(firsts, dtype=np.int64) - lookup.first
+    else:
+        rows = encode(firsts, first_codes)
+    columns = encode(seconds, second_codes)
+
+    valid = (rows >= 0) & (rows < lookup.values.shape[0]) & (columns >= 0)
+    rows, columns = np.where(valid, rows, 0), np.where(valid, columns, 0)
+    found = valid & lookup.known[rows, columns]
+    if name is not None and not found.all():
+        missing = sorted(set((firsts[i], seconds[i]) for i in np.flatnonzero(~found)))
+        raise KeyError("{}: no entry for {} key(s): {}".format(name, len(missing), missing))
+    values = lookup.values[rows, columns]
+    values[~found] = 0 # keys out of range were pointed at the first entry
+    return values, found
+
+def row_stats(lookup):
+    """
+    mean and std of the known entries in every row (e.g. all teams' values in a season)
+    """
+    means = np.array([mean(values[known]) if known.any() else np.nan for values, known in zip(lookup.values, lookup.known)])
+    stds = np.array([std(values[known]) if known.any() else np.nan for values, known in zip(lookup.values, lookup.known)])
+    return means, stds
@@ -0,0 +1,219 @@
+"""
+headless batch pipeline: runs the full enrichment and training sequence of workshopDS.ipynb without the notebook.
+the game table is checkpointed after every stage, so a rerun resumes from the last finished stage,
+checkpoints record what they were computed from (the game log file, the ingest checkpoint, the checkpoints of the
+stages they depend on) and are recomputed when any of it changed. stages that don't depend on each other run
+concurrently in forked worker processes, which share the game table instead of receiving a copy of it.
+usage: python pipeline.py [--game-log GL1990_2017.csv] [--checkpoints checkpoints] [--workers N] [--restart] [--no-train]
+       [--columns COLUMN ...]
+"""
+import argparse
+import os
+import pickle
+import shutil
+import sys
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_all_start_methods, get_context
+from features import registry, dependencies, plan, lineup_features
+from lineups import lineup_matrix
+
+# (name, feature function, stages it depends on)
+stages = [(feature.name, feature.func, tuple(dependencies(feature))) for feature in registry]
+
+def checkpoint_path(directory, name):
+    return os.path.join(directory, name + '.pkl')
+
+def save(obj, path):
+    tmp = path + '.tmp'
+    with open(tmp, 'wb') as fp:
+        pickle.dump(obj, fp, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp, path) # never leave a partially written checkpoint behind
+
+def load(path):
+    with open(path, 'rb') as fp:
+        return pickle.load(fp)
+
+def merge(df, columns):
+    for name, values in columns.items():
+        for r, value in zip(df, values):
+            r[name] = value
+
+table = None # game table of the running wave, inherited by the forked workers
+table_lineups = None # and its lineup matrix
+
+def run_stage(name, df=None, lineups=None):
+    """
+    run a single stage on the game table (default: the shared table and its lineup matrix). returns only the
+    columns it added.
+    lineups: lineup matrix of the game table for the stages reading it (features.lineup_features). built by the
+        stage if not given
+    """
+    if df is None:
+        df, lineups = table, table_lineups
+    func = dict((stage, f) for stage, f, _ in stages)[name]
+    existing = set(df[0])
+    start = time.perf_counter()
+    if name in lineup_features:
+        func(df, lineups=lineups)
+    else:
+        func(df)
+    added = [column for column in df[0] if column not in existing]
+    return {column: [r[column] for r in df] for column in added}, time.perf_counter() - start
+
+def source_id(path):
+    """
+    identity of an input file: absolute path, modification time and size
+    """
+    stat = os.stat(path)
+    return os.path.abspath(path), stat.st_mtime_ns, stat.st_size
+
+def ingest(game_log, directory):
+    """
+    read the game log, or its checkpoint if it was taken from the same file.
+    returns (game records, checkpoint token). the token changes every time the game log is read again
+    """
+    path = checkpoint_path(directory, 'ingest')
+    source = source_id(game_log)
+    if os.path.exists(path):
+        checkpoint = load(path)
+        if isinstance(checkpoint, dict) and checkpoint.get('source') == source: # older checkpoints are plain lists
+            print("{:<22} checkpoint".format('ingest'))
+            return checkpoint['records'], checkpoint['token']
+        print("{:<22} stale checkpoint ({} changed)".format('ingest', game_log))
+    from ingest import read_game_log, game_records
+    start = time.perf_counter()
+    df = game_records(read_game_log(game_log))
+    token = uuid.uuid4().hex
+    save({'token': token, 'source': source, 'records': df}, path)
+    print("{:<22} {:8.2f}s".format('ingest', time.perf_counter() - start))
+    return df, token
+
+def run_forked(wave, df, workers, lineups=None):
+    """
+    run a wave of stages in forked worker processes. the workers inherit the game table and its lineup matrix
+    (copy on write) instead of each receiving a pickled copy, and send back only the columns they added.
+    yields (name, (columns, elapsed))
+    """
+    global table, table_lineups
+    table, table_lineups = df, lineups
+    try:
+        with ProcessPoolExecutor(min(workers, len(wave)), mp_context=get_context('fork')) as executor:
+            futures = [(name, executor.submit(run_stage, name)) for name in wave]
+            for name, future in futures:
+                yield name, future.result()
+    finally:
+        table, table_lineups = None, None
+
+def enrich(df, token, directory, workers=1, columns=None):
+    """
+    run all stages that don't have a valid checkpoint yet, a wave of mutually independent stages at a time.
+    token: ingest checkpoint token of the game table. a stage checkpoint is only used if it was computed from this
+        game table and from the current checkpoints of the stages it depends on, so rerunning a stage also reruns
+        everything downstream of it
+    columns: only run the stages needed for these columns (see features.plan)
+    """
+    if columns is None:
+        needed = stages
+    else:
+        names = set(feature.name for feature in plan(columns, df[0]))
+        needed = [stage for stage in stages if stage[0] in names]
+    requires = dict((name, deps) for name, _, deps in needed)
+    tokens = {} # checkpoint token of every finished stage
+
+    def inputs(name):
+        return (token,) + tuple(tokens[dep] for dep in requires[name])
+
+    for name, _, deps in needed: # in dependency order
+        if os.path.exists(checkpoint_path(directory, name)) and all(dep in tokens for dep in deps):
+            checkpoint = load(checkpoint_path(directory, name))
+            if 'token' in checkpoint and checkpoint.get('inputs') == inputs(name):
+                merge(df, checkpoint['columns'])
+                tokens[name] = checkpoint['token']
+                print("{:<22} checkpoint".format(name))
+    done = set(tokens)
+
+    parallel = workers > 1 and 'fork' in get_all_start_methods() # otherwise stages run one at a time
+    lineups = None # built once for all lineup stages, before forking
+    if any(name in lineup_features and name not in done for name, _, _ in needed):
+        lineups = lineup_matrix(df)
+    while len(done) < len(needed):
+        wave = [name for name, _, deps in needed if name not in done and all(dep in done for dep in deps)]
+        forked = parallel and len(wave) > 1
+        if forked:
+            results = run_forked(wave, df, workers, lineups)
+        else:
+            results = ((name, run_stage(name, df, lineups)) for name in wave)
+
+        wave_columns = []
+        for name, (columns, elapsed) in results:
+            tokens[name] = uuid.uuid4().hex
+            save({'token': tokens[name], 'inputs': inputs(name), 'columns': columns}, checkpoint_path(directory, name))
+            print("{:<22} {:8.2f}s".format(name, elapsed))
+            if forked:
+                wave_columns.append((name, columns))
+            else:
+                done.add(name) # already applied to df in place
+        # merge only once the whole wave is done - its workers are running on the table until then
+        for name, columns in wave_columns:
+            merge(df, columns)
+            done.add(name)
+    return df
+
+def design_matrix(df, directory, columns=None):
+    """
+    export the model matrix and target (attendance in thousands) of the enriched game table to directory/design.
+    columns: dense features of the model (default: all), the one-hot team/division/park blocks are always added.
+    games are shuffled before the export, so train / test splits are contiguous slices (views) of the memory map.
+    returns the encoder, the model matrix (read-only float32 memory map) and the target
+    """
+    import numpy as np
+    import pandas as pd
+    from encoding import DesignEncoder, export, load_design, one_hot_columns, post_game_features
+    data = pd.DataFrame.from_records(df)
+    data = data[(data['attendance'] != 0) & data['attendance'].notnull()]
+    data = data.iloc[np.random.RandomState(1).permutation(len(data))].reset_index(drop=True)
+    target = (data['attendance'].round(-3) / 1000).astype(int)
+    if columns is not None:
+        columns = [column for column in columns if column not in one_hot_columns and column not in post_game_features]
+    export(DesignEncoder().fit(data, columns), data, os.path.join(directory, 'design'), target)
+    encoder, _, matrix, target = load_design(os.path.join(directory, 'design'))
+    return encoder, matrix, target
+
+def train(df, directory, columns=None):
+    from sklearn.ensemble import RandomForestRegressor
+    start = time.perf_counter()
+    encoder, X, Y = design_matrix(df, directory, columns)
+    split = int(len(Y) * 0.8) # games are already shuffled. slices of the memory map are not copied
+    X_train, X_test, y_train, y_test = X[:split], X[split:], Y[:split], Y[split:]
+    model = RandomForestRegressor(n_estimators=20, n_jobs=-1, random_state=1)
+    model.fit(X_train, y_train)
+    rmse = ((model.predict(X_test) - y_test) ** 2).mean() ** .5
+    save({'model': model, 'encoder': encoder}, checkpoint_path(directory, 'model')) # predict with encoder.matrix
+    print("{:<22} {:8.2f}s  (test RMSE {:.3f}, R^2 {:.3f})".format('train', time.perf_counter() - start,
+                                                                     rmse, model.score(X_test, y_test)))
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="run the attendance enrichment and training pipeline")
+    parser.add_argument('--game-log', default="GL1990_2017.csv")
+    parser.add_argument('--checkpoints', default="checkpoints", help="directory holding the stage checkpoints")
+    parser.add_argument('--workers', type=int, default=2, help="processes for independent stages")
+    parser.add_argument('--restart', action='store_true', help="discard existing checkpoints")
+    parser.add_argument('--no-train', action='store_true', help="stop after the enrichment")
+    parser.add_argument('--columns', nargs='+', help="only compute (and train on) these feature columns")
+    args = parser.parse_args(argv)
+
+    if args.restart and os.path.isdir(args.checkpoints):
+        shutil.rmtree(args.checkpoints)
+    os.makedirs(args.checkpoints, exist_ok=True)
+
+    start = time.perf_counter()
+    df, token = ingest(args.game_log, args.checkpoints)
+    df = enrich(df, token, args.checkpoints, args.workers, args.columns)
+    if not args.no_train:
+        train(df, args.checkpoints, args.columns)
+    print("{:<22} {:8.2f}s".format('total', time.perf_counter() - start))
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,113 @@
+"""
+what-if scenarios on top of an enriched game table.
+a scenario is a copy of one game with some of its inputs changed (date, day_of_week, game_time, ticket price, flags).
+only the feature columns that depend on the changed inputs are recomputed, in bulk for the whole batch,
+and all scenarios are scored by the model in a single call.
+"""
+import numpy as np
+import pandas as pd
+from numpy import mean
+from feature_engineering import load_weather, defaults, holiday_flags, ticket_price_normalized
+
+weather_metrics = ['temp', 'wind', 'condition_score']
+
+def month_of(dates):
+    """
+    vectorized feature_engineering.month: almost no games in mar or oct. estimate using apr / sep respectively
+    """
+    months = pd.DatetimeIndex(dates).month.to_numpy()
+    return np.where(months == 3, 4, np.where(months == 10, 9, months))
+
+def weather_columns(dates, home_teams, park_ids, weather_data=None, norm=None):
+    """
+    weather metrics for arbitrary (date, home_team) pairs, resolved the same way as feature_engineering.weather.
+    dates without a game in the weather integration (e.g. a game moved to a new date) fall back to the
+    team/month average, or the overall average if there are not enough entries
+    """
+    if weather_data is None:
+        weather_data, norm = load_weather()
+    observed = pd.DataFrame.from_dict(weather_data, orient='index')
+    observed.index = pd.MultiIndex.from_tuples(observed.index)
+    observed = observed.reindex(pd.MultiIndex.from_arrays([list(dates), list(home_teams)]))
+    months = month_of(dates)
+
+    columns = {}
+    for metric in weather_metrics:
+        value = observed[metric].to_numpy(dtype=float)
+        missing = np.isnan(value) | (value == 0) # same as `value or ...` in weather()
+
+        default = np.array([defaults.get((metric, p)) for p in park_ids], dtype=float)
+        value = np.where(missing, default, value)
+        missing &= np.isnan(default) | (default == 0)
+
+        # team/month average if there are more than 4 entries to compute it with, overall average otherwise
+        overall = mean(norm[metric])
+        climate = {key[1:]: mean(pop) if len(pop) > 4 else overall
+                   for key, pop in norm.items() if isinstance(key, tuple) and key[0] == metric}
+        fallback = np.array([climate.get((m, t), overall) for m, t in zip(months, home_teams)], dtype=float)
+        columns[metric] = np.where(missing, fallback, value)
+    return columns
+
+def apply_scenarios(base, scenarios):
+    """
+    build one perturbed game per scenario.
+    base: enriched game table (DataFrame, one row per game, as produced by the feature functions)
+    scenarios: DataFrame with a 'game' column (index label of the game in base) and any of the columns
+        date, day_of_week, game_time, ticket_price_change or a flag column of base (holiday, rivalry, ...).
+        missing values (NaN) mean the input is left unchanged for that scenario.
+    """
+    games = base.loc[scenarios['game']].reset_index(drop=True)
+    changes = scenarios.drop(columns='game').reset_index(drop=True)
+
+    if 'date' in changes:
+        moved = changes['date'].notna().to_numpy()
+        if moved.any():
+            dates = pd.to_datetime(changes.loc[moved, 'date'])
+            games.loc[moved, 'date'] = dates.dt.date.to_numpy()
+            games.loc[moved, 'day_of_week'] = dates.dt.strftime('%a').to_numpy()
+
+            moved_games = games[moved]
+            games.loc[moved, 'holiday'] = holiday_flags(moved_games['date'], moved_games['home_team'])
+            weather_values = weather_columns(moved_games['date'], moved_games['home_team'], moved_games['park_id'])
+            for metric in weather_metrics:
+                games[metric] = games[metric].astype(float) # fallback values are averages
+                games.loc[moved, metric] = weather_values[metric]
+
+    if 'ticket_price_change' in changes:
+        repriced = changes['ticket_price_change'].notna().to_numpy()
+        if repriced.any():
+            games.loc[repriced, 'avg_ticket_price_normalized'] = ticket_price_normalized(
+                games.loc[repriced, 'season'].to_numpy(), games.loc[repriced, 'home_team'].tolist(),
+                changes.loc[repriced, 'ticket_price_change'].to_numpy())
+
+    # explicit values override the ones derived from the new date
+    for column in changes.columns:
+        if column in ('date', 'ticket_price_change'):
+            continue
+        if column not in games:
+            raise KeyError("unknown scenario column: {}".format(column))
+        changed = changes[column].notna().to_numpy()
+        games.loc[changed, column] = changes.loc[changed, column].to_numpy()
+    return games
+
+def run_scenarios(base, scenarios, model, encode):
+    """
+    score a batch of what-if scenarios and report the attendance change for each of them.
+    model: fitted estimator with a predict method
+    encode: callable turning a game table into the model's design matrix (the same transformation used in training),
+            e.g. the matrix method of the DesignEncoder saved with the model
+    returns the scenarios with base_attendance, scenario_attendance and delta columns
+    """
+    perturbed = apply_scenarios(base, scenarios)
+    originals = pd.unique(scenarios['game'])
+
+    # score the original games and all scenarios in a single model call
+    predictions = np.asarray(model.predict(encode(pd.concat([base.loc[originals].reset_index(drop=True), perturbed],
+                                                            ignore_index=True))))
+    base_attendance = pd.Series(predictions[:len(originals)], index=originals)
+
+    result = scenarios.reset_index(drop=True).copy()
+    result['base_attendance'] = base_attendance.loc[scenarios['game']].to_numpy()
+    result['scenario_attendance'] = predictions[len(originals):]
+    result['delta'] = result['scenario_attendance'] - result['base_attendance']
+    return result